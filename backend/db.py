@@ -1,35 +1,146 @@
+import math
 import os
-from datetime import datetime
+import sqlite3
+from datetime import datetime, timezone
 
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, ForeignKey, text
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+from sqlalchemy import create_engine, event, Column, Integer, BigInteger, LargeBinary, String, Float, DateTime, Boolean, ForeignKey, Index, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import declarative_base, sessionmaker, scoped_session, relationship
+from sqlalchemy.pool import SingletonThreadPool, StaticPool
+from sqlalchemy.schema import CreateIndex
 
 # Default: local SQLite for development
 DEFAULT_SQLITE_URL = "sqlite:///./reports.db"
 
 # If DATABASE_URL env var is set (e.g. on Render), use that instead
 DATABASE_URL = os.getenv("DATABASE_URL", DEFAULT_SQLITE_URL)
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+IS_MEMORY_SQLITE = IS_SQLITE and make_url(DATABASE_URL).database in (None, "", ":memory:")
+
+if IS_MEMORY_SQLITE:
+    # sqlite:// is private to each connection; name it and share the cache
+    # so the writer's engine and the async read engine see one database
+    DATABASE_URL = "sqlite:///file:animal_report?mode=memory&cache=shared&uri=true"
+
+# Shared by the sync engine and the async read engine below so the two
+# pools can't drift apart
+if IS_MEMORY_SQLITE:
+    # Memory databases get single-connection pools, which take no sizing
+    _POOL_KWARGS = {}
+elif IS_SQLITE:
+    # File databases get a QueuePool; size it for concurrent readers (the
+    # writer thread holds just one connection)
+    _POOL_KWARGS = {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+    }
+else:
+    # Postgres: size the QueuePool for concurrent requests instead of the
+    # default 5 + 10 overflow. LIFO keeps hot connections in use and lets
+    # idle overflow ones time out.
+    _POOL_KWARGS = {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "20")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "30")),
+        "pool_recycle": 3600,
+        "pool_pre_ping": True,
+        "pool_use_lifo": True,
+    }
 
 # For SQLite we need the special connect_args; for Postgres we don't
-if DATABASE_URL.startswith("sqlite"):
+if IS_MEMORY_SQLITE:
+    # One connection per thread keeps the shared-cache database alive
     engine = create_engine(
-        DATABASE_URL,
-        connect_args={"check_same_thread": False},
+        DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=SingletonThreadPool,
     )
+elif IS_SQLITE:
+    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False}, **_POOL_KWARGS)
 else:
-    engine = create_engine(DATABASE_URL)
+    engine = create_engine(DATABASE_URL, **_POOL_KWARGS)
+
+def _null_safe(fn):
+    return lambda x: None if x is None else fn(x)
+
+
+def _sqlite_pragmas(dbapi_conn, _):
+    # Runs once per physical connection: WAL lets readers run alongside
+    # the writer, and NORMAL sync skips the fsync on every commit.
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute("PRAGMA busy_timeout=5000")  # wait out a checkpoint instead of "database is locked"
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA mmap_size=268435456")  # 256 MiB
+    cur.execute("PRAGMA cache_size=-65536")  # 64 MiB
+
+    # The incident distance query and recalc need math functions; SQLite
+    # builds without SQLITE_ENABLE_MATH_FUNCTIONS don't have them
+    try:
+        cur.execute("SELECT sin(0), cos(0), asin(0), sqrt(0), radians(0), floor(0)")
+    except sqlite3.OperationalError:
+        for name, fn in (("sin", math.sin), ("cos", math.cos), ("asin", math.asin),
+                         ("sqrt", math.sqrt), ("radians", math.radians), ("floor", math.floor)):
+            dbapi_conn.create_function(name, 1, _null_safe(fn), deterministic=True)
+    cur.close()
+
+
+if IS_SQLITE:
+    event.listen(engine, "connect", _sqlite_pragmas)
+
+
+def _async_url(url: str):
+    # Same database through an asyncio driver: aiosqlite / asyncpg
+    u = make_url(url)
+    if IS_SQLITE:
+        return u.set(drivername="sqlite+aiosqlite")
+    if "sslmode" in u.query:
+        # asyncpg spells libpq's sslmode as ssl
+        u = u.difference_update_query(["sslmode"]).update_query_dict({"ssl": u.query["sslmode"]})
+    return u.set(drivername="postgresql+asyncpg")
+
+
+# Read-only routes run on the event loop against this engine; the report
+# writer thread keeps the sync engine above. AUTOCOMMIT: reads skip the
+# BEGIN/COMMIT round trip entirely
+ASYNC_READ_ENGINE = create_async_engine(
+    _async_url(DATABASE_URL),
+    # asyncio can't use the per-thread pool; one connection does fine
+    **({"poolclass": StaticPool} if IS_MEMORY_SQLITE else _POOL_KWARGS),
+    isolation_level="AUTOCOMMIT",
+)
+if IS_SQLITE:
+    event.listen(ASYNC_READ_ENGINE.sync_engine, "connect", _sqlite_pragmas)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
 
 Base = declarative_base()
 
 
+def utcnow() -> datetime:
+    """Naive UTC now, matching the naive DateTime columns (datetime.utcnow() is deprecated)."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# incidents.bucket_key packs (lat_bucket, lon_bucket) into one int; at the
+# 1e-3 degree grid |lon_bucket| <= 180_000, so keys never collide
+BUCKET_KEY_STRIDE = 1_000_000
+
+
+def bucket_key(lat_b: int, lon_b: int) -> int:
+    return lat_b * BUCKET_KEY_STRIDE + lon_b
+
+
 class IncidentRecord(Base):
     __tablename__ = "incidents"
+    __table_args__ = (
+        # find_candidate_incident: type = / bucket_key IN (3x3 cells) / recent window
+        Index("ix_incidents_type_bucket_key", "type", "bucket_key", "last_report_at"),
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
-    status = Column(String, nullable=False, default="pending", index=True)  # pending|confirmed|closed
-    type = Column(String, nullable=False, index=True)  # dead|injured
+    id = Column(Integer, primary_key=True)
+    status = Column(String, nullable=False, default="pending")  # pending|confirmed|closed
+    type = Column(String, nullable=False)  # dead|injured
 
     centroid_lat = Column(Float, nullable=False)
     centroid_lon = Column(Float, nullable=False)
@@ -40,39 +151,136 @@ class IncidentRecord(Base):
     report_count = Column(Integer, nullable=False, default=0)
     unique_device_count = Column(Integer, nullable=False, default=0)
 
-    lat_bucket = Column(Integer, nullable=False, index=True)
-    lon_bucket = Column(Integer, nullable=False, index=True)
+    lat_bucket = Column(Integer, nullable=False)
+    lon_bucket = Column(Integer, nullable=False)
+    # nullable only because older databases get it via ALTER TABLE + backfill
+    bucket_key = Column(BigInteger, nullable=True)
 
     reports = relationship("ReportRecord", back_populates="incident")
 
 
+REPORT_BUCKET_SCALE = 10_000  # 4 decimal places
+HASH_BYTES = 16
+
+
+def _report_bucket(coord_col: str):
+    # Column default rather than an ORM event so Core inserts fill it too
+    def default(ctx):
+        v = ctx.get_current_parameters().get(coord_col)
+        return math.floor(v * REPORT_BUCKET_SCALE) if v is not None else None
+    return default
+
+
+REPORTS_TS_DESC_INCLUDE = ["type", "latitude", "longitude", "id", "accepted", "incident_id"]
+
+
 class ReportRecord(Base):
     __tablename__ = "reports"
+    __table_args__ = (
+        # /reports: ORDER BY timestamp DESC LIMIT n as an index scan. On
+        # Postgres INCLUDE carries every column the listing selects or
+        # filters on, so it is index-only; SQLite still visits the table.
+        Index(
+            "ix_reports_ts_desc",
+            text("timestamp DESC"),
+            postgresql_include=REPORTS_TS_DESC_INCLUDE,
+        ),
+        # should_reject: throttle count, then last accepted same-type report
+        Index("ix_reports_device_received", "device_hash", "received_at"),
+        Index("ix_reports_dev_type_acc_recv", "device_hash", "type", "accepted", "received_at"),
+        # /reports and /stats: accepted rows by timestamp
+        Index("ix_reports_accepted_ts", "accepted", "timestamp"),
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     type = Column(String, index=True)
     latitude = Column(Float)
     longitude = Column(Float)
     timestamp = Column(DateTime)
 
     # --- anti-spam + grouping (new) ---
-    received_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    # Always the app's naive-UTC clock: should_reject compares it against
+    # utcnow() windows, so it must not come from the DB server's now()
+    received_at = Column(DateTime, nullable=False, default=utcnow, index=True)
 
-    device_hash = Column(String, nullable=True, index=True)
-    ip_hash = Column(String, nullable=True)
-    ua_hash = Column(String, nullable=True)
+    # raw 16-byte BLAKE2b digests: half the width of hex in every index
+    device_hash = Column(LargeBinary(HASH_BYTES), nullable=True)
+    ip_hash = Column(LargeBinary(HASH_BYTES), nullable=True)
+    ua_hash = Column(LargeBinary(HASH_BYTES), nullable=True)
 
-    accepted = Column(Boolean, nullable=False, default=True, index=True)
+    accepted = Column(Boolean, nullable=False, default=True)
     reject_reason = Column(String, nullable=True)
 
     incident_id = Column(Integer, ForeignKey("incidents.id"), nullable=True, index=True)
     incident = relationship("IncidentRecord", back_populates="reports")
 
+    # ~11m grid cell, persisted so clustering can GROUP BY plain ints
+    # (indexed together in ensure_schema) instead of ROUND() per row
+    lat_bucket = Column(Integer, nullable=True, default=_report_bucket("latitude"))
+    lon_bucket = Column(Integer, nullable=True, default=_report_bucket("longitude"))
+
+
+class SchemaMeta(Base):
+    __tablename__ = "schema_meta"
+
+    key = Column(String, primary_key=True)
+    value = Column(String)
+
+
+# Bump whenever ensure_schema() gains new statements, so existing
+# databases pick them up on the next boot.
+CURRENT_SCHEMA_VERSION = "10"
+
+
+# Columns added to `reports` after its first release: name -> (SQLite, Postgres) type
+REPORT_PATCH_COLUMNS = {
+    "received_at": ("TIMESTAMP", "timestamptz"),
+    "device_hash": ("BLOB", "bytea"),
+    "ip_hash": ("BLOB", "bytea"),
+    "ua_hash": ("BLOB", "bytea"),
+    "accepted": ("BOOLEAN", "boolean"),
+    "reject_reason": ("VARCHAR", "text"),
+    "incident_id": ("INTEGER", "integer"),
+    "lat_bucket": ("INTEGER", "integer"),
+    "lon_bucket": ("INTEGER", "integer"),
+}
+
+# Columns added to `incidents` after its first release
+INCIDENT_PATCH_COLUMNS = {
+    "bucket_key": ("BIGINT", "bigint"),
+}
+
+# Indexes not declared on the models: name -> "table (columns)"
+PATCH_INDEXES = {
+    "idx_reports_bucket": "reports (lat_bucket, lon_bucket, type)",
+    "idx_incidents_status_last": "incidents (status, last_report_at)",
+}
+
+# Indexes earlier schemas created that are now duplicates, prefixes of a
+# composite above, or unused: each one is extra work on every insert
+REDUNDANT_INDEXES = (
+    "ix_reports_id",                # the primary key
+    "ix_reports_device_hash",       # prefix of ix_reports_device_received
+    "idx_reports_device_hash",
+    "ix_reports_accepted",          # prefix of ix_reports_accepted_ts
+    "idx_reports_received_at",      # duplicate of ix_reports_received_at
+    "idx_reports_incident_id",      # duplicate of ix_reports_incident_id
+    "ix_incidents_id",              # the primary key
+    "ix_incidents_type",            # prefix of ix_incidents_type_bucket_key
+    "ix_incidents_status",          # prefix of idx_incidents_status_last
+    "ix_incidents_lat_bucket",      # candidates are looked up by bucket_key
+    "ix_incidents_lon_bucket",
+    "idx_incidents_bucket",
+    "ix_incidents_scan",            # superseded by ix_incidents_type_bucket_key
+)
+
 
 def _try_exec(conn, sql: str):
-    # Best-effort schema patching: ignore "already exists" type errors
+    # Best-effort patching: ignore errors, but inside a savepoint so one
+    # failure doesn't abort the surrounding Postgres transaction
     try:
-        conn.execute(text(sql))
+        with conn.begin_nested():
+            conn.execute(text(sql))
     except Exception:
         pass
 
@@ -80,44 +288,113 @@ def _try_exec(conn, sql: str):
 def ensure_schema():
     """
     create_all creates new tables, but does NOT add columns to existing ones.
-    This function safely adds new columns/indexes if missing.
+    This function inspects the live schema once and issues only the
+    ALTER / CREATE INDEX statements that are actually missing, all in a
+    single transaction.
     """
-    is_sqlite = DATABASE_URL.startswith("sqlite")
     with engine.begin() as conn:
-        if is_sqlite:
-            # SQLite: no IF NOT EXISTS for ADD COLUMN; rely on try/except
-            _try_exec(conn, "ALTER TABLE reports ADD COLUMN received_at TIMESTAMP")
-            _try_exec(conn, "ALTER TABLE reports ADD COLUMN device_hash VARCHAR")
-            _try_exec(conn, "ALTER TABLE reports ADD COLUMN ip_hash VARCHAR")
-            _try_exec(conn, "ALTER TABLE reports ADD COLUMN ua_hash VARCHAR")
-            _try_exec(conn, "ALTER TABLE reports ADD COLUMN accepted BOOLEAN")
-            _try_exec(conn, "ALTER TABLE reports ADD COLUMN reject_reason VARCHAR")
-            _try_exec(conn, "ALTER TABLE reports ADD COLUMN incident_id INTEGER")
-        else:
-            # Postgres: do it properly + idempotently
-            _try_exec(conn, "ALTER TABLE public.reports ADD COLUMN IF NOT EXISTS received_at timestamptz")
-            _try_exec(conn, "ALTER TABLE public.reports ADD COLUMN IF NOT EXISTS device_hash text")
-            _try_exec(conn, "ALTER TABLE public.reports ADD COLUMN IF NOT EXISTS ip_hash text")
-            _try_exec(conn, "ALTER TABLE public.reports ADD COLUMN IF NOT EXISTS ua_hash text")
-            _try_exec(conn, "ALTER TABLE public.reports ADD COLUMN IF NOT EXISTS accepted boolean")
-            _try_exec(conn, "ALTER TABLE public.reports ADD COLUMN IF NOT EXISTS reject_reason text")
-            _try_exec(conn, "ALTER TABLE public.reports ADD COLUMN IF NOT EXISTS incident_id integer")
+        insp = inspect(conn)
+
+        for name, patch_columns in (("reports", REPORT_PATCH_COLUMNS), ("incidents", INCIDENT_PATCH_COLUMNS)):
+            table = name if IS_SQLITE else f"public.{name}"
+            existing_cols = {c["name"] for c in insp.get_columns(name)}
+            for col, (sqlite_type, pg_type) in patch_columns.items():
+                if col in existing_cols:
+                    continue
+                # Other workers booting at the same time may add it first
+                # (the inspection above is not a lock)
+                if IS_SQLITE:
+                    # no ADD COLUMN IF NOT EXISTS; a duplicate is the only expected failure
+                    _try_exec(conn, f"ALTER TABLE {table} ADD COLUMN {col} {sqlite_type}")
+                else:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {col} {pg_type}"))
+
+        if not IS_SQLITE:
+            # schema v4-v7 gave received_at a DB-clock default; the app binds it now
+            _try_exec(conn, "ALTER TABLE public.reports ALTER COLUMN received_at DROP DEFAULT")
+
+            # hashes used to be stored as hex text; rewrite them as bytea
+            # (SQLite columns are untyped, so old hex values just age out of
+            # the throttle/duplicate windows there)
+            hex_cols = [c["name"] for c in insp.get_columns("reports")
+                        if c["name"] in ("device_hash", "ip_hash", "ua_hash")
+                        and not isinstance(c["type"], LargeBinary)]
+            for col in hex_cols:
+                _try_exec(conn, f"ALTER TABLE public.reports ALTER COLUMN {col} TYPE bytea USING decode({col}, 'hex')")
 
         # Defaults / backfill (safe to run repeatedly)
-        if is_sqlite:
+        if IS_SQLITE:
             _try_exec(conn, "UPDATE reports SET accepted = 1 WHERE accepted IS NULL")
         else:
             _try_exec(conn, "UPDATE public.reports SET accepted = COALESCE(accepted, true)")
         _try_exec(conn, "UPDATE reports SET received_at = COALESCE(received_at, timestamp)")
+        if IS_SQLITE:
+            # CAST truncates toward zero; step negatives down to match floor()
+            for col, src in (("lat_bucket", "latitude"), ("lon_bucket", "longitude")):
+                x = f"({src} * {REPORT_BUCKET_SCALE})"
+                _try_exec(conn, f"UPDATE reports SET {col} = CAST({x} AS INTEGER) - ({x} < CAST({x} AS INTEGER)) "
+                                f"WHERE {col} IS NULL AND {src} IS NOT NULL")
+        else:
+            _try_exec(conn, f"UPDATE public.reports SET lat_bucket = FLOOR(latitude * {REPORT_BUCKET_SCALE})::integer "
+                            "WHERE lat_bucket IS NULL AND latitude IS NOT NULL")
+            _try_exec(conn, f"UPDATE public.reports SET lon_bucket = FLOOR(longitude * {REPORT_BUCKET_SCALE})::integer "
+                            "WHERE lon_bucket IS NULL AND longitude IS NOT NULL")
+
+        _try_exec(conn, f"UPDATE incidents SET bucket_key = CAST(lat_bucket AS BIGINT) * {BUCKET_KEY_STRIDE} + lon_bucket "
+                        "WHERE bucket_key IS NULL")
 
         # Indexes
-        _try_exec(conn, "CREATE INDEX IF NOT EXISTS idx_reports_device_hash ON reports (device_hash)")
-        _try_exec(conn, "CREATE INDEX IF NOT EXISTS idx_reports_received_at ON reports (received_at)")
-        _try_exec(conn, "CREATE INDEX IF NOT EXISTS idx_reports_incident_id ON reports (incident_id)")
-        _try_exec(conn, "CREATE INDEX IF NOT EXISTS idx_incidents_bucket ON incidents (lat_bucket, lon_bucket, last_report_at)")
-        _try_exec(conn, "CREATE INDEX IF NOT EXISTS idx_incidents_status_last ON incidents (status, last_report_at)")
+        for name in REDUNDANT_INDEXES:
+            _try_exec(conn, f"DROP INDEX IF EXISTS {name}")
+        if not IS_SQLITE:
+            # schema v4-v8 built ix_reports_ts_desc with a shorter INCLUDE
+            # list; drop it so it is recreated below with the current one
+            for i in insp.get_indexes("reports"):
+                if (i["name"] == "ix_reports_ts_desc"
+                        and i.get("dialect_options", {}).get("postgresql_include") != REPORTS_TS_DESC_INCLUDE):
+                    _try_exec(conn, "DROP INDEX IF EXISTS ix_reports_ts_desc")
+            insp.clear_cache()
+        existing_idx = {i["name"] for t in ("reports", "incidents") for i in insp.get_indexes(t)}
+        for name, target in PATCH_INDEXES.items():
+            if name not in existing_idx:
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {target}"))
+
+        # Explicit model indexes (__table_args__): create_all only builds them with a new table
+        for model in (ReportRecord, IncidentRecord):
+            for idx in getattr(model, "__table_args__", ()):
+                if isinstance(idx, Index) and idx.name not in existing_idx:
+                    # IF NOT EXISTS, not checkfirst: a concurrent worker may
+                    # create it between the check and the CREATE
+                    conn.execute(CreateIndex(idx, if_not_exists=True))
+
+
+def _schema_version(session):
+    try:
+        row = session.get(SchemaMeta, "version")
+    except Exception:
+        return None
+    return row.value if row else None
 
 
 def init_db():
-    Base.metadata.create_all(bind=engine)
-    ensure_schema()
+    try:
+        Base.metadata.create_all(bind=engine)
+    except DBAPIError:
+        # a concurrently booting worker created a table between create_all's
+        # existence check and its CREATE; the retry sees it and skips it
+        Base.metadata.create_all(bind=engine)
+
+    # ensure_schema() is a burst of ALTER/CREATE INDEX round trips (and
+    # table locks on Postgres); only run it when the stored version is stale
+    with SessionLocal() as session:
+        if _schema_version(session) == CURRENT_SCHEMA_VERSION:
+            return
+        session.rollback()
+
+        ensure_schema()
+        session.merge(SchemaMeta(key="version", value=CURRENT_SCHEMA_VERSION))
+        try:
+            session.commit()
+        except IntegrityError:
+            # another worker stored the version row first
+            session.rollback()
@@ -1,12 +1,41 @@
+from concurrent.futures import Future
 from datetime import datetime
+import uuid
 
 from fastapi.testclient import TestClient
+from sqlalchemy import event
 
-from main import app
+from db import ASYNC_READ_ENGINE
+from main import ReportWriter, ResponseCache, app, response_cache
 
 client = TestClient(app)
 
 
+def test_report_writer_skips_cancelled():
+    writer = ReportWriter()
+    futures = []
+    for i in range(3):
+        item = {
+            "type": "dead",
+            "latitude": 45.0 + i * 0.01,
+            "longitude": 2.0,
+            "timestamp": datetime.utcnow(),
+            "device_hash": None,
+            "ip_hash": None,
+            "ua_hash": None,
+        }
+        fut = Future()
+        writer._queue.put((item, fut))
+        futures.append(fut)
+    futures[1].cancel()
+
+    writer._ensure_started()
+    assert futures[0].result(timeout=5)["accepted"]
+    assert futures[2].result(timeout=5)["accepted"]
+    assert futures[1].cancelled()
+    writer.stop(timeout=5)
+
+
 def test_root():
     resp = client.get("/")
     assert resp.status_code == 200
@@ -56,3 +85,154 @@ def test_create_and_list_reports():
     data = resp2.json()
     assert isinstance(data, list)
     assert any(item["type"] in ["dead", "injured"] for item in data)
+
+
+def test_dashboard_gzip_and_etag():
+    resp = client.get("/dashboard")
+    assert resp.status_code == 200
+    assert resp.headers["content-encoding"] == "gzip"
+    assert "Animal Incidents Map" in resp.text
+
+    resp2 = client.get("/dashboard", headers={"If-None-Match": resp.headers["etag"]})
+    assert resp2.status_code == 304
+
+
+def test_report_clusters():
+    payload = {
+        "type": "injured",
+        "latitude": 53.12344,
+        "longitude": -1.54321,
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+    resp = client.post("/report", json=payload)
+    assert resp.status_code == 200
+
+    resp2 = client.get("/reports/clusters")
+    assert resp2.status_code == 200
+    data = resp2.json()
+    assert any(
+        c["type"] == "injured"
+        and abs(c["lat"] - 53.12344) < 1e-4
+        and abs(c["lon"] + 1.54321) < 1e-4
+        and c["count"] >= 1
+        for c in data
+    )
+
+
+def test_stats():
+    resp = client.get("/stats")
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["window_total"] == data["total"]
+    assert sum(data["by_type"].values()) <= data["window_total"]
+
+    resp2 = client.get("/stats?from=2000-01-01&to=2000-01-02")
+    assert resp2.status_code == 200
+    assert resp2.json()["window_total"] == 0
+
+
+def test_reports_etag_not_modified():
+    resp = client.get("/reports?limit=5")
+    assert resp.status_code == 200
+    etag = resp.headers["etag"]
+
+    resp2 = client.get("/reports?limit=5", headers={"If-None-Match": etag})
+    assert resp2.status_code == 304
+    assert resp2.headers["etag"] == etag
+
+
+def test_cached_reads_skip_the_pool():
+    checkouts = []
+    listener = lambda *args: checkouts.append(1)
+    event.listen(ASYNC_READ_ENGINE.sync_engine, "checkout", listener)
+    try:
+        client.get("/reports?limit=7")
+        for _ in range(5):
+            assert client.get("/reports?limit=7").status_code == 200
+    finally:
+        event.remove(ASYNC_READ_ENGINE.sync_engine, "checkout", listener)
+    assert len(checkouts) == 1
+
+
+def test_incident_confirmed_after_enough_reports():
+    run = uuid.uuid4().hex
+    data = None
+    for i in range(5):
+        payload = {
+            "type": "dead",
+            "latitude": 48.0 + i * 0.0001,
+            "longitude": -3.0,
+            "timestamp": datetime.utcnow().isoformat(),
+        }
+        resp = client.post("/report", json=payload, headers={"User-Agent": f"{run}-{i % 3}"})
+        assert resp.status_code == 200
+        data = resp.json()
+        assert data["accepted"]
+
+    assert data["incident_status"] == "confirmed"
+
+
+def test_duplicate_report_rejected():
+    headers = {"User-Agent": f"dup-{uuid.uuid4().hex}"}
+    payload = {
+        "type": "injured",
+        "latitude": 47.0,
+        "longitude": -4.0,
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+    first = client.post("/report", json=payload, headers=headers).json()
+    second = client.post("/report", json=payload, headers=headers).json()
+
+    assert first["accepted"]
+    assert not second["accepted"]
+    assert second["reject_reason"] == "duplicate_nearby"
+    assert second["incident_id"] is None
+
+
+def test_incidents_etag_not_modified():
+    resp = client.get("/incidents?status=all")
+    assert resp.status_code == 200
+    assert isinstance(resp.json(), list)
+    etag = resp.headers["etag"]
+
+    resp2 = client.get("/incidents?status=all", headers={"If-None-Match": etag})
+    assert resp2.status_code == 304
+
+    # past the cache: the fingerprint still recognises the unchanged list
+    response_cache.clear()
+    resp3 = client.get("/incidents?status=all", headers={"If-None-Match": etag})
+    assert resp3.status_code == 304
+    assert resp3.headers["etag"] == etag
+
+
+def test_response_cache_is_bounded():
+    cache = ResponseCache(max_entries=2)
+    for i in range(3):
+        cache.put(("k", i), {"i": i})
+    assert cache.get(("k", 0)) is None
+    assert cache.get(("k", 1)) is not None
+    assert cache.get(("k", 2)) is not None
+
+
+def test_incidents_include_reports():
+    # fresh spot per run (./reports.db outlives the test session), with a
+    # 17-significant-digit latitude that a 15-digit float rendering would round
+    lat = 10 + uuid.uuid4().int % 40_000 / 1000 + 1e-14
+    # whole seconds: the nested timestamp must format like the top-level ones
+    ts = datetime.utcnow().replace(microsecond=0).isoformat()
+    payload = {"type": "sleeping", "latitude": lat, "longitude": -1.0, "timestamp": ts}
+    first = client.post("/report", json=payload, headers={"User-Agent": uuid.uuid4().hex}).json()
+    second = client.post("/report", json=payload, headers={"User-Agent": uuid.uuid4().hex}).json()
+    assert first["accepted"] and second["accepted"]
+    assert first["incident_id"] == second["incident_id"]
+
+    resp = client.get("/incidents?status=all&include=reports")
+    assert resp.status_code == 200
+    incident = next(i for i in resp.json() if i["id"] == first["incident_id"])
+    nested = incident["reports"]
+    # ordered by id
+    assert [r["id"] for r in nested][-2:] == [first["id"], second["id"]]
+    assert nested[-1]["latitude"] == lat
+    assert nested[-1]["timestamp"] == ts == incident["last_report_at"]
+
+    assert "reports" not in client.get("/incidents?status=all").json()[0]